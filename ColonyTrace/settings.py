@@ -78,9 +78,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests instead of opening one, and applying the pragmas below, per request
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds to wait on a locked database before raising "database is locked"
+            'timeout': 20,
+            # Take the write lock at BEGIN so atomic blocks that read before writing wait out the
+            # timeout above instead of failing when they try to upgrade to a write lock
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Pragmas applied to every new SQLite connection (see colonyDB.db.configure_sqlite_connection).
+# WAL lets readers keep working while a writer is active, and synchronous=NORMAL is safe under WAL.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+    'wal_autocheckpoint': 1000,
+}
+
+# Defaults for colonyDB.db.MeasurementWriteQueue: pending inserts are written in batches of this size,
+# or after this many seconds, whichever comes first.
+MEASUREMENT_WRITE_BATCH_SIZE = 50
+MEASUREMENT_WRITE_MAX_DELAY = 0.5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
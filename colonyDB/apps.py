@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ColonydbConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'colonyDB'
+
+    def ready(self):
+        from .db import configure_sqlite_connection
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='colonyDB.configure_sqlite_connection')
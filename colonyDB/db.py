@@ -0,0 +1,146 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    # Applies settings.SQLITE_PRAGMAS to each new SQLite connection
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+# Default for MeasurementWriteQueue arguments that fall back to a setting, since None disables the timed flush
+_FROM_SETTINGS = object()
+
+
+def _is_lock_error(exc):
+    # SQLITE_BUSY and SQLITE_LOCKED surface as "database is locked" or "database table is locked"
+    return isinstance(exc, OperationalError) and 'locked' in str(exc)
+
+
+class MeasurementWriteQueue:
+    """
+    Coalesces high-frequency measurement inserts (e.g. AnimalWeight, TumorVolume) into batched
+    bulk_create calls so concurrent writers take the SQLite write lock far less often.
+
+    Pending instances are written when batch_size is reached, when max_delay seconds have passed
+    since the first pending instance, or on flush(). batch_size and max_delay default to
+    settings.MEASUREMENT_WRITE_BATCH_SIZE and settings.MEASUREMENT_WRITE_MAX_DELAY; an explicit
+    max_delay of None disables the timed flush.
+
+    Durability is delayed: an added instance is not in the database until its batch is written, and
+    pending instances are lost if the process exits first, so owners of a queue must call flush()
+    before shutting down. If a batch fails because the database is locked it is logged and put back
+    at the front of the queue; flush() re-raises the error and the timed flush retries after another
+    max_delay. Any other error (e.g. IntegrityError) is not retried: the batch is written again one
+    instance at a time, instances that still fail are logged and dropped, and the error is re-raised.
+    """
+
+    def __init__(self, batch_size=None, max_delay=_FROM_SETTINGS, using='default'):
+        if batch_size is None:
+            batch_size = getattr(settings, 'MEASUREMENT_WRITE_BATCH_SIZE', 50)
+        if max_delay is _FROM_SETTINGS:
+            max_delay = getattr(settings, 'MEASUREMENT_WRITE_MAX_DELAY', 0.5)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.using = using
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def add(self, instance):
+        with self._lock:
+            self._pending.append(instance)
+            full = len(self._pending) >= self.batch_size
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+
+    def flush(self):
+        # Writes every pending instance, grouped by model, in a single transaction
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        unsaved = [instance for instance in pending if instance.pk is None]
+        by_model = {}
+        for instance in pending:
+            by_model.setdefault(type(instance), []).append(instance)
+        try:
+            with transaction.atomic(using=self.using):
+                for model, instances in by_model.items():
+                    model.objects.using(self.using).bulk_create(instances)
+        except Exception as exc:
+            # bulk_create may have assigned primary keys before the rollback
+            self._reset(unsaved)
+            if _is_lock_error(exc):
+                logger.exception("Failed to write %d queued measurements; they remain queued", len(pending))
+                self._requeue(pending)
+            else:
+                logger.exception("Failed to write %d queued measurements; writing them one at a time",
+                                 len(pending))
+                self._write_separately(pending)
+            raise
+        return len(pending)
+
+    def _write_separately(self, instances):
+        # Writes each instance in its own transaction, dropping the ones that cannot be written
+        for index, instance in enumerate(instances):
+            unsaved = instance.pk is None
+            try:
+                with transaction.atomic(using=self.using):
+                    type(instance).objects.using(self.using).bulk_create([instance])
+            except Exception as exc:
+                self._reset([instance] if unsaved else [])
+                if _is_lock_error(exc):
+                    logger.exception("Database locked; %d queued measurements remain queued",
+                                     len(instances) - index)
+                    self._requeue(instances[index:])
+                    return
+                logger.exception("Dropped queued measurement %r", instance)
+
+    def _requeue(self, instances):
+        with self._lock:
+            self._pending[:0] = instances
+            self._schedule()
+
+    @staticmethod
+    def _reset(instances):
+        for instance in instances:
+            instance.pk = None
+            instance._state.adding = True
+
+    def _schedule(self):
+        # Starts the timed flush if enabled and not already running; caller must hold self._lock
+        if self.max_delay is not None and self._timer is None and self._pending:
+            self._timer = threading.Timer(self.max_delay, self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            # Already logged by flush()
+            pass
+        finally:
+            # Timer threads open their own connection, which would otherwise be left dangling
+            connections[self.using].close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
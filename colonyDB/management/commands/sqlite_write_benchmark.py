@@ -0,0 +1,96 @@
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from colonyDB.db import MeasurementWriteQueue
+from colonyDB.models import Animal, AnimalWeight
+
+BENCHMARK_ANIMAL_ID = '__sqlite_write_benchmark__'
+
+
+class Command(BaseCommand):
+    help = ('Measure AnimalWeight insert throughput with N simultaneous writers. WARNING: writes benchmark rows '
+            'to and deletes them from the configured database (normally the production db.sqlite3)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help='Numbers of simultaneous writer threads to benchmark')
+        parser.add_argument('--inserts', type=int, default=200, help='Inserts per writer')
+        parser.add_argument('--batch-size', type=int, default=settings.MEASUREMENT_WRITE_BATCH_SIZE,
+                            help='Batch size for the coalesced mode')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        self.stdout.write(f"journal_mode={journal_mode}, inserts per writer={options['inserts']}")
+        self.stdout.write(f"{'mode':<10}{'writers':>8}{'rows':>8}{'seconds':>10}{'rows/s':>10}"
+                          f"{'lockerr':>8}{'lost':>8}")
+
+        # Remove a benchmark animal left behind by an earlier run that crashed
+        Animal.objects.filter(animal_id=BENCHMARK_ANIMAL_ID).delete()
+        animal = Animal.objects.create(
+            animal_id=BENCHMARK_ANIMAL_ID,
+            date_of_birth=date.today(),
+            sex='U',
+            species='Mus Musculus',
+            strain='benchmark',
+            protocol='benchmark',
+            use='U'
+        )
+        try:
+            for writers in options['writers']:
+                for mode in ('direct', 'coalesced'):
+                    rows, seconds, lock_errors = self.run_writers(animal, writers, options['inserts'], mode,
+                                                             options['batch_size'])
+                    lost = writers * options['inserts'] - rows
+                    self.stdout.write(f"{mode:<10}{writers:>8}{rows:>8}{seconds:>10.3f}"
+                                      f"{rows / seconds:>10.0f}{lock_errors:>8}{lost:>8}")
+                    AnimalWeight.objects.filter(animal=animal).delete()
+        finally:
+            # Deleting the animal cascades to any remaining benchmark weights
+            animal.delete()
+
+    def run_writers(self, animal, writers, inserts, mode, batch_size):
+        # Returns rows written, elapsed seconds and the number of OperationalErrors raised. A failed direct
+        # save loses its row, while a failed coalesced flush keeps its batch queued for the next attempt,
+        # so rows actually missing at the end are reported separately as lost.
+        lock_errors = []
+        barrier = threading.Barrier(writers)
+
+        def write():
+            from django.db import connection as thread_connection
+            # Each writer batches its own inserts
+            queue = MeasurementWriteQueue(batch_size=batch_size, max_delay=None)
+            barrier.wait()
+            try:
+                for i in range(inserts):
+                    weight = AnimalWeight(animal=animal, date=date.today(), weight_units=0,
+                                          weight=Decimal('20.000') + i % 10)
+                    try:
+                        if mode == 'direct':
+                            weight.save()
+                        else:
+                            queue.add(weight)
+                    except OperationalError:
+                        lock_errors.append(1)
+                if mode == 'coalesced':
+                    try:
+                        queue.flush()
+                    except OperationalError:
+                        lock_errors.append(1)
+            finally:
+                thread_connection.close()
+
+        threads = [threading.Thread(target=write) for _ in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+        rows = AnimalWeight.objects.filter(animal=animal).count()
+        return rows, seconds, len(lock_errors)
@@ -1,9 +1,15 @@
 from decimal import Decimal
 import datetime
-from django.test import TestCase
+import time
+from unittest import mock
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 from datetime import date
-from .models import Animal, AnimalWeight, TreatmentRecord, TreatmentPlan
+from .db import MeasurementWriteQueue
+from .models import Animal, AnimalWeight, ImplantedTumor, TreatmentRecord, TreatmentPlan, Tumor, TumorVolume
 
 
 class TestAnimalAge(TestCase):
@@ -145,4 +151,146 @@ class TestActualDose(TestCase):
     def test_actual_dose(self):
         # Test the actual_dose property
         expected_dose = Decimal(43.902)
-        self.assertTrue((self.treatment_record.actual_dose - expected_dose) < 0.0001)
\ No newline at end of file
+        self.assertTrue((self.treatment_record.actual_dose - expected_dose) < 0.0001)
+
+
+class TestSqliteConnectionPragmas(TestCase):
+    def test_pragmas_applied(self):
+        # Test the connect timeout and pragmas from settings are applied when the connection is created
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.DATABASES['default']['OPTIONS']['timeout'] * 1000)
+            cursor.execute('PRAGMA temp_store')
+            # temp_store MEMORY is reported as 2
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+class TestMeasurementWriteQueue(TestCase):
+    def setUp(self):
+        self.animal = Animal.objects.create(
+            animal_id=1,
+            date_of_birth=date(2022, 1, 1),
+            sex='M',
+            species='Mouse',
+            strain='Balb/c'
+        )
+        self.queue = MeasurementWriteQueue(batch_size=3, max_delay=None)
+
+    def make_weight(self, day):
+        return AnimalWeight(animal=self.animal, date=date(2022, 1, day), weight_units=0, weight=Decimal('20.000'))
+
+    def test_flush_on_batch_size(self):
+        # Test pending weights are held until the batch size is reached
+        self.queue.add(self.make_weight(1))
+        self.queue.add(self.make_weight(2))
+        self.assertEqual(AnimalWeight.objects.count(), 0)
+        self.assertEqual(len(self.queue), 2)
+        self.queue.add(self.make_weight(3))
+        self.assertEqual(AnimalWeight.objects.count(), 3)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_explicit_flush(self):
+        # Test flush writes a partial batch and reports how many rows were written
+        self.queue.add(self.make_weight(1))
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(self.queue.flush(), 0)
+        self.assertEqual(self.animal.weight(date(2022, 1, 1)), Decimal('20.000'))
+
+    def test_failed_flush_keeps_pending(self):
+        # Test a failed write re-raises, logs and leaves every instance queued for the next flush
+        self.queue.add(self.make_weight(1))
+        self.queue.add(self.make_weight(2))
+        with mock.patch.object(QuerySet, 'bulk_create', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('colonyDB.db', level='ERROR'):
+                with self.assertRaises(OperationalError):
+                    self.queue.add(self.make_weight(3))
+        self.assertEqual(AnimalWeight.objects.count(), 0)
+        self.assertEqual(len(self.queue), 3)
+        self.assertEqual(self.queue.flush(), 3)
+        self.assertEqual(AnimalWeight.objects.count(), 3)
+
+    def test_failed_flush_resets_assigned_primary_keys(self):
+        # Test instances given primary keys before the batch rolled back are inserted as fresh rows on retry
+        tumor = Tumor.objects.create(source_species='Mouse', source_sex='F', tumor_type='Melanoma')
+        implanted_tumor = ImplantedTumor.objects.create(tumor=tumor, implant_date=date(2022, 2, 1),
+                                                        implant_location='Flank', implantation_method='Injection')
+        weight = self.make_weight(1)
+        tumor_volume = TumorVolume(animal=self.animal, implanted_tumor=implanted_tumor, method='Calipers',
+                                   datetime=timezone.make_aware(datetime.datetime(2022, 2, 8, 9, 0, 0)),
+                                   volume=Decimal('120.50'))
+        self.queue.add(weight)
+        self.queue.add(tumor_volume)
+
+        real_bulk_create = QuerySet.bulk_create
+        assigned = []
+
+        def bulk_create(queryset, objs, *args, **kwargs):
+            # AnimalWeight is written first and gets its primary key, then TumorVolume fails
+            if queryset.model is TumorVolume:
+                raise OperationalError('database is locked')
+            created = real_bulk_create(queryset, objs, *args, **kwargs)
+            assigned.extend(obj.pk for obj in created)
+            return created
+
+        with mock.patch.object(QuerySet, 'bulk_create', bulk_create):
+            with self.assertLogs('colonyDB.db', level='ERROR'):
+                with self.assertRaises(OperationalError):
+                    self.queue.flush()
+        self.assertIsNotNone(assigned[0])
+        self.assertIsNone(weight.pk)
+        self.assertTrue(weight._state.adding)
+        self.assertEqual(AnimalWeight.objects.count(), 0)
+
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(AnimalWeight.objects.count(), 1)
+        self.assertEqual(TumorVolume.objects.count(), 1)
+        self.assertIsNotNone(weight.pk)
+
+    def test_defaults_from_settings(self):
+        # Test unspecified arguments fall back to the settings while an explicit None disables the timed flush
+        with self.settings(MEASUREMENT_WRITE_BATCH_SIZE=7, MEASUREMENT_WRITE_MAX_DELAY=2.5):
+            queue = MeasurementWriteQueue()
+            self.assertEqual(queue.batch_size, 7)
+            self.assertEqual(queue.max_delay, 2.5)
+            self.assertIsNone(MeasurementWriteQueue(max_delay=None).max_delay)
+            self.assertEqual(MeasurementWriteQueue(batch_size=0).batch_size, 0)
+
+
+class TestMeasurementWriteQueueCommits(TransactionTestCase):
+    # SQLite foreign keys are only checked on commit, so these tests need real transactions
+    def setUp(self):
+        self.animal = Animal.objects.create(
+            animal_id=1,
+            date_of_birth=date(2022, 1, 1),
+            sex='M',
+            species='Mouse',
+            strain='Balb/c'
+        )
+
+    def make_weight(self, day, animal_id=None):
+        return AnimalWeight(animal_id=animal_id or self.animal.pk, date=date(2022, 1, day), weight_units=0,
+                            weight=Decimal('20.000'))
+
+    def test_bad_instance_does_not_block_queue(self):
+        # Test an instance with a nonexistent animal is dropped while the valid instances around it are written
+        queue = MeasurementWriteQueue(batch_size=3, max_delay=None)
+        queue.add(self.make_weight(1))
+        queue.add(self.make_weight(2, animal_id=999999))
+        with self.assertLogs('colonyDB.db', level='ERROR'):
+            with self.assertRaises(IntegrityError):
+                queue.add(self.make_weight(3))
+        self.assertEqual(AnimalWeight.objects.count(), 2)
+        self.assertEqual(len(queue), 0)
+        queue.add(self.make_weight(4))
+        self.assertEqual(queue.flush(), 1)
+        self.assertEqual(AnimalWeight.objects.count(), 3)
+
+    def test_timed_flush(self):
+        # Test pending weights are written by the timer without calling flush()
+        queue = MeasurementWriteQueue(batch_size=10, max_delay=0.05)
+        queue.add(self.make_weight(1))
+        deadline = time.monotonic() + 5
+        while not AnimalWeight.objects.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(AnimalWeight.objects.count(), 1)
+        self.assertEqual(len(queue), 0)